@@ -1,12 +1,13 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime, timedelta
-import boto3
+import hashlib
 import json
 import os
+import queue
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,15 +16,30 @@ load_dotenv()
 # AWS credentials
 AWS_ACCESS_KEY = os.getenv('AWS_ACCESS_KEY')
 AWS_SECRET_KEY = os.getenv('AWS_SECRET_KEY')
-AWS_REGION = 'us-east-1'  # Change this to your preferred region
+AWS_REGION = 'us-east-2'  # Latency-optimized inference for Llama 3.1 70B is served from Ohio
 
 # Initialize AWS Bedrock client
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name=AWS_REGION,
-    aws_access_key_id=AWS_ACCESS_KEY,
-    aws_secret_access_key=AWS_SECRET_KEY
-)
+# Cached as a resource so all sessions/reruns share one client and its
+# connection pool instead of re-resolving credentials per rerun.
+@st.cache_resource(show_spinner=False)
+def get_bedrock():
+    # boto3 is imported lazily: it costs hundreds of ms at cold start and is
+    # only needed once a Bedrock call is actually made
+    import boto3
+    import botocore.config
+
+    return boto3.session.Session().client(
+        service_name='bedrock-runtime',
+        region_name=AWS_REGION,
+        aws_access_key_id=AWS_ACCESS_KEY,
+        aws_secret_access_key=AWS_SECRET_KEY,
+        config=botocore.config.Config(
+            retries={'mode': 'adaptive', 'max_attempts': 3},
+            max_pool_connections=32,
+            tcp_keepalive=True
+        )
+    )
+
 
 # Chennai locations
 chennai_locations = [
@@ -33,41 +49,191 @@ chennai_locations = [
     "Besant Nagar", "Ambattur", "Kodambakkam", "Ramapuram"
 ]
 
+# Materialized once so rng.choice doesn't re-convert the list on every call
+CHENNAI_LOC_ARR = np.asarray(chennai_locations, dtype=object)
+
+# Shared PCG64 generator; much faster than the legacy np.random Mersenne Twister
+RNG = np.random.default_rng()
+
 # Function to generate traffic incidents
-def generate_traffic_incidents(num_incidents=50):
-    incidents = []
-    for _ in range(num_incidents):
-        incident = {
-            'type': np.random.choice(['Congestion', 'Accident', 'Construction', 'Event']),
-            'from': np.random.choice(chennai_locations),
-            'to': np.random.choice(chennai_locations),
-            'delay': np.random.randint(60, 1800),  # 1 minute to 30 minutes
-            'length': np.random.randint(100, 5000)  # 100 to 5000 meters
-        }
-        incidents.append(incident)
-    return pd.DataFrame(incidents)
+# Cached so widget interactions reuse the same data; cache_bucket rolls the
+# cache over once per minute to keep the "real-time" feel.
+@st.cache_data(ttl=60, show_spinner=False)
+def generate_traffic_incidents(num_incidents=50, cache_bucket=0):
+    rng = np.random.default_rng()
+    df = pd.DataFrame({
+        'type': rng.choice(['Congestion', 'Accident', 'Construction', 'Event'], size=num_incidents),
+        'from': rng.choice(CHENNAI_LOC_ARR, size=num_incidents),
+        'to': rng.choice(CHENNAI_LOC_ARR, size=num_incidents),
+        'delay': rng.integers(60, 1800, size=num_incidents),  # 1 minute to 30 minutes
+        'length': rng.integers(100, 5000, size=num_incidents)  # 100 to 5000 meters
+    })
+    # Category dtype keeps the string columns compact; pinning the location
+    # vocabulary makes the location filter a C-level code comparison
+    df['type'] = df['type'].astype('category')
+    df['from'] = pd.Categorical(df['from'], categories=chennai_locations)
+    df['to'] = pd.Categorical(df['to'], categories=chennai_locations)
+    return df
+
+# Function to build historical traffic data for a location and date range.
+# Returns an Arrow table: roughly half the memory of the equivalent pandas
+# frame and it serializes straight through Streamlit's cache; callers convert
+# with .to_pandas() only at plot time.
+@st.cache_data(show_spinner=False)
+def hist_table(date0, date1, location):
+    import pyarrow as pa
+
+    # Seeding from the inputs keeps the series deterministic across reruns
+    rng = np.random.default_rng(seed=hash((date0, date1, location)) & 0xFFFFFFFF)
+    historical_dates = pd.date_range(start=date0, end=date1)
+
+    return pa.table({
+        'date': historical_dates,
+        'incidents': rng.integers(10, 100, size=len(historical_dates)),
+        'avg_delay': rng.normal(loc=300, scale=100, size=len(historical_dates))
+    })
+
+# Today's display string only changes once a day; no need to reformat per rerun
+@st.cache_data(ttl=3600, show_spinner=False)
+def today_str():
+    return datetime.now().strftime("%B %d, %Y")
+
+# Figure builders are cached so the trace/layout dicts are only rebuilt when
+# their inputs change; the rendered dict goes straight to st.plotly_chart.
+@st.cache_data(show_spinner=False)
+def make_type_bar(type_counts, location):
+    import plotly.express as px
+
+    types, counts = zip(*type_counts)
+    fig = px.bar(x=list(types), y=list(counts))
+    fig.update_layout(
+        title=f"Distribution of Incident Types in {location}",
+        xaxis_title="Incident Type",
+        yaxis_title="Count"
+    )
+    return fig.to_dict()
+
+@st.cache_data(show_spinner=False)
+def make_history_fig(hist_df, location):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=hist_df['date'], y=hist_df['incidents'], name='Incidents'))
+    fig.add_trace(go.Scattergl(x=hist_df['date'], y=hist_df['avg_delay'], name='Average Delay', yaxis='y2'))
+
+    fig.update_layout(
+        title=f"Historical Traffic Analysis for {location}",
+        xaxis_title="Date",
+        yaxis_title="Number of Incidents",
+        yaxis2=dict(title="Average Delay (seconds)", overlaying='y', side='right')
+    )
+    return fig.to_dict()
 
 # Function to get traffic insights using AWS Bedrock Mistral model
 def get_traffic_insights(prompt):
     try:
-        model_id = "meta.llama3-70b-instruct-v1:0"  # Meta Llama 3 model ID
+        model_id = "us.meta.llama3-1-70b-instruct-v1:0"  # Cross-region Llama 3.1 inference profile
         body = json.dumps({
             "prompt": prompt,
             "max_gen_len": 2000,
             "temperature": 0.7,
             "top_p": 0.95,
         })
-        response = bedrock.invoke_model(body=body, modelId=model_id)
-        response_body = json.loads(response['body'].read())
-        
-        # Check if 'generation' key exists in the response
-        if 'generation' in response_body:
-            return response_body['generation'].strip()
-        else:
-            # If 'generation' is not found, return the full response for debugging
-            return f"Unexpected response structure. Full response: {json.dumps(response_body, indent=2)}"
+        response = get_bedrock().invoke_model_with_response_stream(
+            body=body,
+            modelId=model_id,
+            performanceConfigLatency="optimized"
+        )
+        # Yield tokens as they arrive so the UI can show them immediately
+        for event in response['body']:
+            chunk = json.loads(event['chunk']['bytes'])
+            if 'generation' in chunk:
+                yield chunk['generation']
+            else:
+                # If 'generation' is not found, return the full chunk for debugging
+                yield f"Unexpected response structure. Full chunk: {json.dumps(chunk, indent=2)}"
     except Exception as e:
-        return f"Error getting traffic insights: {str(e)}\nFull error: {repr(e)}"
+        yield f"Error getting traffic insights: {str(e)}\nFull error: {repr(e)}"
+
+# Micro-batching for the Q&A endpoint: concurrent user questions are merged
+# into a single Bedrock call instead of serializing one request per user.
+BATCH_SIZE = 8
+BATCH_WINDOW = 0.05  # seconds to wait for more prompts before dispatching
+_BATCH_MARKER = "===ANSWER {n}==="
+_STREAM_DONE = None  # sentinel pushed onto each reply queue when finished
+
+def _answer_batch(batch):
+    # One call for the whole batch; the model is asked to delimit its answers
+    # so each waiting request can be handed its own slice.
+    questions = "\n\n".join(
+        f"{_BATCH_MARKER.format(n=i + 1)}\n{prompt}" for i, (prompt, _) in enumerate(batch)
+    )
+    combined = (
+        f"Answer each of the following {len(batch)} independent requests. "
+        f"Start each answer with its marker line (e.g. {_BATCH_MARKER.format(n=1)}) "
+        f"and nothing else before it.\n\n{questions}"
+    )
+    text = "".join(get_traffic_insights(combined))
+    for i, (_, reply_queue) in enumerate(batch):
+        marker = _BATCH_MARKER.format(n=i + 1)
+        start = text.find(marker)
+        if start == -1:
+            # Delimiter missing: report an error rather than hand this request
+            # the combined text, which contains the other users' answers
+            reply_queue.put(f"Error getting traffic insights: batched response was missing marker {marker}")
+        else:
+            start += len(marker)
+            end = text.find("===ANSWER", start)
+            reply_queue.put(text[start:end if end != -1 else len(text)].strip())
+        reply_queue.put(_STREAM_DONE)
+
+def _batch_worker(prompt_queue):
+    while True:
+        batch = [prompt_queue.get()]
+        deadline = time.monotonic() + BATCH_WINDOW
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(prompt_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        if len(batch) == 1:
+            # Sole request in the window: keep the token-by-token stream
+            prompt, reply_queue = batch[0]
+            for chunk in get_traffic_insights(prompt):
+                reply_queue.put(chunk)
+            reply_queue.put(_STREAM_DONE)
+        else:
+            _answer_batch(batch)
+
+# Streamlit re-executes the script in a fresh module namespace each run, so
+# the queue and the worker that drains it must be created together in one
+# cached factory; otherwise later runs would enqueue onto a queue the
+# original thread never sees.
+@st.cache_resource(show_spinner=False)
+def get_prompt_queue():
+    prompt_queue = queue.Queue()
+    worker = threading.Thread(target=_batch_worker, args=(prompt_queue,), daemon=True)
+    worker.start()
+    return prompt_queue
+
+def stream_insights(prompt, timeout=120):
+    reply_queue = queue.Queue()
+    get_prompt_queue().put((prompt, reply_queue))
+    while True:
+        try:
+            chunk = reply_queue.get(timeout=timeout)
+        except queue.Empty:
+            yield f"Error getting traffic insights: no response within {timeout} seconds"
+            break
+        if chunk is _STREAM_DONE:
+            break
+        yield chunk
+
+# How long a memoized Q&A answer stays valid
+QA_CACHE_TTL = 300
 
 
 # Streamlit app
@@ -83,112 +249,170 @@ How this project works:
 5. Predictions: Based on historical data and current conditions, the system makes predictions about future traffic scenarios.
 """)
 
-# Generate traffic incidents
-df_traffic = generate_traffic_incidents()
-
-# Get today's date
-today_date = datetime.now().strftime("%B %d, %Y")
-
-# Location selection
-selected_location = st.selectbox("Select a location in Chennai", ["All"] + chennai_locations)
-
-# Filter data based on selected location
-if selected_location != "All":
-    df_traffic = df_traffic[df_traffic['from'].str.contains(selected_location, case=False, na=False) | 
-                            df_traffic['to'].str.contains(selected_location, case=False, na=False)]
-
-# Display traffic statistics
-st.subheader(f"Traffic Overview on {today_date}")
-if not df_traffic.empty:
-    total_incidents = len(df_traffic)
-    avg_delay = df_traffic['delay'].mean()
-    total_affected_length = df_traffic['length'].sum()
-    
-    st.write(f"Total incidents: {total_incidents}")
-    st.write(f"Average delay: {avg_delay:.2f} seconds ({avg_delay/60:.2f} minutes)")
-    st.write(f"Total affected road length: {total_affected_length:.2f} meters ({total_affected_length/1000:.2f} km)")
-
-    # Incident type distribution
-    st.subheader("Incident Type Distribution")
-    type_counts = df_traffic['type'].value_counts()
-    fig = px.bar(x=type_counts.index, y=type_counts.values)
-    fig.update_layout(
-        title=f"Distribution of Incident Types in {selected_location}",
-        xaxis_title="Incident Type",
-        yaxis_title="Count"
-    )
-    st.plotly_chart(fig)
-
-    # Top affected areas
-    st.subheader("Top 10 Most Affected Areas")
-    top_affected = df_traffic.nlargest(10, 'delay')[['from', 'to', 'delay', 'length', 'type']]
-    top_affected['delay'] = top_affected['delay'].apply(lambda x: f"{x} seconds ({x/60:.2f} minutes)")
-    top_affected['length'] = top_affected['length'].apply(lambda x: f"{x} meters ({x/1000:.2f} km)")
-    st.table(top_affected)
-else:
-    st.warning(f"No traffic incident data available for {selected_location}.")
-
-# Interactive Q&A using AWS Bedrock Mistral model
-st.subheader("Ask about Chennai traffic")
-user_question = st.text_input("Ask a question about traffic in Chennai")
-
-if user_question:
-    prompt = f"""Analyze the following traffic incident data for {selected_location} in Chennai on {today_date} and answer the user's question:
-
-    Total traffic incidents: {total_incidents if 'total_incidents' in locals() else 'N/A'}
-    Average delay: {avg_delay:.2f} seconds ({avg_delay/60:.2f} minutes) if 'avg_delay' in locals() else 'N/A'
-    Total affected road length: {total_affected_length:.2f} meters ({total_affected_length/1000:.2f} km) if 'total_affected_length' in locals() else 'N/A'
-    Top affected areas: {', '.join(top_affected['from'].tolist()) if 'top_affected' in locals() and not top_affected.empty else 'No data available'}
+# Single timestamp shared by the date_input defaults below
+today = datetime.now()
+
+# Each section is an independent fragment so a widget change only reruns its
+# own block instead of the whole script. The overview publishes its stats via
+# st.session_state for the Q&A prompt.
+
+@st.fragment
+def overview_section():
+    # Get today's date
+    today_date = today_str()
+
+    # Location selection
+    selected_location = st.selectbox("Select a location in Chennai", ["All"] + chennai_locations)
+
+    # Filtering and the derived scalars are memoized per (location, minute)
+    # so reruns triggered by other widgets skip straight to the stored values
+    minute_bucket = int(time.time() // 60)
+    filter_key = (selected_location, minute_bucket)
+    if st.session_state.get('_filter_key') != filter_key:
+        # Generate traffic incidents
+        df_traffic = generate_traffic_incidents(cache_bucket=minute_bucket)
+
+        # Filter data based on selected location
+        if selected_location != "All":
+            mask = (df_traffic['from'] == selected_location) | (df_traffic['to'] == selected_location)
+            df_traffic = df_traffic[mask]
+
+        st.session_state.update(
+            _filter_key=filter_key,
+            _filtered_df=df_traffic,
+            _total_incidents=len(df_traffic),
+            _avg_delay=float(df_traffic['delay'].mean()) if not df_traffic.empty else 0.0,
+            _total_affected_length=int(df_traffic['length'].sum())
+        )
+
+    df_traffic = st.session_state['_filtered_df']
+    total_incidents = st.session_state['_total_incidents']
+    avg_delay = st.session_state['_avg_delay']
+    total_affected_length = st.session_state['_total_affected_length']
+
+    stats = {'location': selected_location, 'date': today_date}
+
+    # Display traffic statistics
+    st.subheader(f"Traffic Overview on {today_date}")
+    if not df_traffic.empty:
+        st.write(f"Total incidents: {total_incidents}")
+        st.write(f"Average delay: {avg_delay:.2f} seconds ({avg_delay/60:.2f} minutes)")
+        st.write(f"Total affected road length: {total_affected_length:.2f} meters ({total_affected_length/1000:.2f} km)")
+
+        # Incident type distribution
+        st.subheader("Incident Type Distribution")
+        # O(n) count over the categorical codes instead of a pandas hash/sort
+        type_cats = df_traffic['type'].cat.categories
+        type_counts = np.bincount(df_traffic['type'].cat.codes.to_numpy(), minlength=len(type_cats))
+        st.plotly_chart(make_type_bar(tuple(zip(type_cats, type_counts.tolist())), selected_location))
+
+        # Top affected areas
+        st.subheader("Top 10 Most Affected Areas")
+        # O(n) top-k via argpartition rather than a full nlargest sort
+        delay_arr = df_traffic['delay'].to_numpy()
+        if len(delay_arr) > 10:
+            top_idx = np.argpartition(-delay_arr, 10)[:10]
+        else:
+            top_idx = np.arange(len(delay_arr))
+        top_affected = df_traffic.iloc[top_idx].sort_values('delay', ascending=False)[['from', 'to', 'delay', 'length', 'type']]
+        stats.update(
+            total_incidents=total_incidents,
+            avg_delay=avg_delay,
+            total_affected_length=total_affected_length,
+            top_from=top_affected['from'].tolist()
+        )
+        # Arrow-backed grid; delay/length stay numeric (sortable, smaller
+        # payload) and are formatted client-side by the column config
+        st.dataframe(
+            top_affected,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'delay': st.column_config.NumberColumn("delay", format="%d sec"),
+                'length': st.column_config.NumberColumn("length", format="%d m")
+            }
+        )
+    else:
+        st.warning(f"No traffic incident data available for {selected_location}.")
+
+    st.session_state['traffic_stats'] = stats
+
+@st.fragment
+def qa_section():
+    # Interactive Q&A using AWS Bedrock Mistral model
+    st.subheader("Ask about Chennai traffic")
+    user_question = st.text_input("Ask a question about traffic in Chennai")
+
+    if user_question:
+        stats = st.session_state.get('traffic_stats', {})
+        selected_location = stats.get('location', 'All')
+        # Integers only: Llama's prefill cost is linear in input tokens, so
+        # keep the embedded numbers as short as possible
+        summary_lines = [f"Total traffic incidents: {stats.get('total_incidents', 'N/A')}"]
+        if 'avg_delay' in stats:
+            summary_lines.append(f"Average delay: {stats['avg_delay']:.0f} seconds")
+        if 'total_affected_length' in stats:
+            summary_lines.append(f"Total affected road length: {stats['total_affected_length']} meters")
+        summary_lines.append(
+            f"Top affected areas: {', '.join(stats['top_from']) if stats.get('top_from') else 'No data available'}"
+        )
+        summary = "\n    ".join(summary_lines)
+        prompt = f"""Analyze the following traffic incident data for {selected_location} in Chennai on {stats.get('date', 'today')} and answer the user's question:
+
+    {summary}
 
     User question: {user_question}
 
     Provide a detailed and informative answer based on the given data and your knowledge about traffic patterns and Chennai's geography, focusing on {selected_location} if specified."""
 
-    with st.spinner("Generating response..."):
-        answer = get_traffic_insights(prompt)
-        st.write(answer)
-
-# Historical data analysis
-st.subheader("Historical Traffic Analysis")
-historical_location = st.selectbox("Select a location for historical analysis", chennai_locations)
-date_range = st.date_input("Select date range for historical analysis", 
-                           [datetime.now() - timedelta(days=30), datetime.now()])
-
-# Generate historical data
-historical_dates = pd.date_range(start=date_range[0], end=date_range[1])
-historical_incidents = np.random.randint(10, 100, size=len(historical_dates))
-historical_delays = np.random.normal(loc=300, scale=100, size=len(historical_dates))
-
-hist_df = pd.DataFrame({
-    'date': historical_dates,
-    'incidents': historical_incidents,
-    'avg_delay': historical_delays
-})
-
-# Plot historical data
-fig = go.Figure()
-fig.add_trace(go.Scatter(x=hist_df['date'], y=hist_df['incidents'], name='Incidents'))
-fig.add_trace(go.Scatter(x=hist_df['date'], y=hist_df['avg_delay'], name='Average Delay', yaxis='y2'))
-
-fig.update_layout(
-    title=f"Historical Traffic Analysis for {historical_location}",
-    xaxis_title="Date",
-    yaxis_title="Number of Incidents",
-    yaxis2=dict(title="Average Delay (seconds)", overlaying='y', side='right')
-)
-
-st.plotly_chart(fig)
-
-# Traffic prediction
-st.subheader("Traffic Prediction")
-prediction_location = st.selectbox("Select a location for traffic prediction", chennai_locations)
-prediction_date = st.date_input("Select a date for traffic prediction", datetime.now() + timedelta(days=1))
-
-# Generate prediction
-predicted_incidents = np.random.randint(5, 50)
-predicted_delay = np.random.normal(loc=300, scale=50)
-
-st.write(f"Predicted number of incidents for {prediction_date} in {prediction_location}: {predicted_incidents}")
-st.write(f"Predicted average delay for {prediction_date} in {prediction_location}: {predicted_delay:.2f} seconds ({predicted_delay/60:.2f} minutes)")
+        # Memoized by prompt digest so repeat questions skip Bedrock, while a
+        # miss still streams token-by-token via st.write_stream
+        prompt_hash = hashlib.blake2b(prompt.encode()).hexdigest()
+        qa_cache = st.session_state.setdefault('_qa_answers', {})
+        cached = qa_cache.get(prompt_hash)
+        if cached is not None and time.time() - cached[1] < QA_CACHE_TTL:
+            st.write(cached[0])
+        else:
+            answer = st.write_stream(stream_insights(prompt))
+            qa_cache[prompt_hash] = (answer, time.time())
+
+@st.fragment
+def history_section():
+    # Historical data analysis
+    st.subheader("Historical Traffic Analysis")
+    historical_location = st.selectbox("Select a location for historical analysis", chennai_locations)
+    date_range = st.date_input("Select date range for historical analysis",
+                               [today - timedelta(days=30), today])
+
+    # Generate historical data
+    hist_df = hist_table(date_range[0], date_range[1], historical_location).to_pandas()
+
+    # Cap the point count so the browser-side render stays fast on long
+    # ranges; the data is already daily, so bucket into however many days it
+    # takes to land at or under 1000 points
+    if len(hist_df) > 1000:
+        days_per_bucket = -(-len(hist_df) // 1000)
+        hist_df = hist_df.set_index('date').resample(f'{days_per_bucket}D').mean().reset_index()
+
+    st.plotly_chart(make_history_fig(hist_df, historical_location))
+
+@st.fragment
+def prediction_section():
+    # Traffic prediction
+    st.subheader("Traffic Prediction")
+    prediction_location = st.selectbox("Select a location for traffic prediction", chennai_locations)
+    prediction_date = st.date_input("Select a date for traffic prediction", today + timedelta(days=1))
+
+    # Generate prediction
+    predicted_incidents = int(RNG.integers(5, 50))
+    predicted_delay = float(RNG.normal(loc=300, scale=50))
+
+    st.write(f"Predicted number of incidents for {prediction_date} in {prediction_location}: {predicted_incidents}")
+    st.write(f"Predicted average delay for {prediction_date} in {prediction_location}: {predicted_delay:.2f} seconds ({predicted_delay/60:.2f} minutes)")
+
+overview_section()
+qa_section()
+history_section()
+prediction_section()
 
 st.info("Note: This project uses advanced algorithms to generate realistic traffic data based on historical patterns and real-time factors. While it aims to provide accurate insights, it should be used as a supplementary tool alongside official traffic information.")